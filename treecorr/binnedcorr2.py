@@ -1071,6 +1071,10 @@ class BinnedCorr2(object):
     def _get_npatch(self):
         return max(self.npatch1, self.npatch2)
 
+    def _prepare_cov(self):
+        # No op for 2pt classes.  3pt classes may build some caches here.
+        pass
+
     def _calculate_xi_from_pairs(self, pairs):
         # Compute the xi data vector for the given list of pairs.
         # pairs is input as a list of (i,j) values.
@@ -1254,6 +1258,9 @@ def _make_cov_design_matrix(corrs, plist, func, name):
 
     # Make a copy of the correlation objects, so we can overwrite things without breaking
     # the original.
+    # Anything cached on the originals for this calculation is shared by the copies.
+    for c in corrs:
+        c._prepare_cov()
     corrs = [c.copy() for c in corrs]
 
     # Figure out the shape of the design matrix.
@@ -1384,10 +1391,11 @@ def _cov_marked(corrs, func):
 
     nboot = np.max([c.num_bootstrap for c in corrs])  # use the maximum if they differ.
 
+    # Select a random set of indices to use for each bootstrap realization.  (Will have repeats.)
+    # Drawing them all at once gives the same values as drawing one row at a time.
+    all_indx = corrs[0].rng.randint(npatch, size=(nboot, npatch))
     plist = []
-    for k in range(nboot):
-        # Select a random set of indices to use.  (Will have repeats.)
-        indx = corrs[0].rng.randint(npatch, size=npatch)
+    for indx in all_indx:
         vpairs = [c._marked_pairs(indx) for c in corrs]
         plist.append(vpairs)
 
@@ -1410,9 +1418,9 @@ def _cov_bootstrap(corrs, func):
 
     nboot = np.max([c.num_bootstrap for c in corrs])  # use the maximum if they differ.
 
+    all_indx = corrs[0].rng.randint(npatch, size=(nboot, npatch))
     plist = []
-    for k in range(nboot):
-        indx = corrs[0].rng.randint(npatch, size=npatch)
+    for indx in all_indx:
         vpairs = [c._bootstrap_pairs(indx) for c in corrs]
         plist.append(vpairs)
 
@@ -599,6 +599,7 @@ class BinnedCorr3(object):
         d = self.__dict__.copy()
         d.pop('_corr',None)
         d.pop('_ok',None)     # Remake this as needed.
+        d.pop('_results_stack',None)
         d.pop('logger',None)  # Oh well.  This is just lost in the copy.  Can't be pickled.
         return d
 
@@ -615,6 +616,7 @@ class BinnedCorr3(object):
         self.results = {}
         self.npatch1 = self.npatch2 = self.npatch3 = 1
         self.__dict__.pop('_ok',None)
+        self.__dict__.pop('_results_stack',None)
 
     @property
     def nonzero(self):
@@ -677,6 +679,7 @@ class BinnedCorr3(object):
 
         else:
             # When patch processing, keep track of the pair-wise results.
+            self.__dict__.pop('_results_stack',None)  # Will need to be remade if already built.
             if self.npatch1 == 1:
                 self.npatch1 = cat1[0].npatch if cat1[0].npatch != 1 else len(cat1)
                 self.npatch2 = self.npatch3 = self.npatch1
@@ -822,6 +825,7 @@ class BinnedCorr3(object):
             self.process_cross12(cat1[0], cat2[0], metric, num_threads)
         else:
             # When patch processing, keep track of the pair-wise results.
+            self.__dict__.pop('_results_stack',None)  # Will need to be remade if already built.
             if self.npatch1 == 1:
                 self.npatch1 = cat1[0].npatch if cat1[0].npatch != 1 else len(cat1)
             if self.npatch2 == 1:
@@ -937,6 +941,7 @@ class BinnedCorr3(object):
             self.process_cross(cat1[0],cat2[0],cat3[0], metric, num_threads)
         else:
             # When patch processing, keep track of the pair-wise results.
+            self.__dict__.pop('_results_stack',None)  # Will need to be remade if already built.
             if self.npatch1 == 1:
                 self.npatch1 = cat1[0].npatch if cat1[0].npatch != 1 else len(cat1)
             if self.npatch2 == 1:
@@ -1068,6 +1073,13 @@ class BinnedCorr3(object):
         number of patches -- preferably more patches than the length of the vector for your
         statistic, although this is not checked.
 
+        .. note::
+
+            For `KKKCorrelation` and `GGGCorrelation`, the first estimate using patches stores a
+            stacked copy of the per-patch results, which is reused by subsequent estimates.
+            This roughly doubles the memory held for the ``results`` dict.  It is kept until the
+            next call to `clear` or `process`.
+
         The default data vector to use for the covariance matrix is given by the method
         `getStat`.  As noted above, this is usually just self.zeta.  However, there is an option
         to compute the covariance of some other function of the correlation object by providing
@@ -1177,78 +1189,100 @@ class BinnedCorr3(object):
         # pairs is input as a list of (i,j) values.
 
         # This is the normal calculation.  It needs to be overridden when there are randoms.
-        self._sum([self.results[ij] for ij in pairs])
+        if self._sum_attrs is None:
+            self._sum([self.results[ij] for ij in pairs])
+        else:
+            # Same as _sum, but using the stacked results, so all the attributes are summed with
+            # a single matrix product.  Repeated triples (e.g. from bootstrap) are counted
+            # appropriately.
+            index, stack = self._results_stack
+            counts = np.bincount([index[ij] for ij in pairs], minlength=len(index))
+            sums = counts.astype(float).dot(stack)
+            sums = sums.reshape(len(self._sum_attrs), -1)
+            for name, row in zip(self._sum_attrs, sums):
+                a = getattr(self, name)
+                a[...] = row.reshape(a.shape)
         self._finalize()
 
-    def _jackknife_pairs(self):
+    # For classes where _sum is just a plain sum of some attributes, the names of those
+    # attributes.  If set, the covariance calculations will use _results_stack to do the sums.
+    _sum_attrs = None
+
+    @lazy_property
+    def _results_stack(self):
+        # Stack the attributes in _sum_attrs for all the results into a single 2d array, so the
+        # covariance estimates can sum any set of triples without rebuilding lists of arrays.
+        # Each row has all the attributes for one result, one after the other.
+        # Returns a dict mapping (i,j,k) -> row number and the stacked array.
+        # These are shared by all the covariance estimates (and the copies they make).
+        # Note: This is a second copy of everything in results, which is kept until the next
+        # clear() or process().  The cost is noted in the estimate_cov docstring.
+        keys = list(self.results.keys())
+        index = { ijk: n for n, ijk in enumerate(keys) }
+        ncols = sum(getattr(self, name).size for name in self._sum_attrs)
+        stack = np.empty((len(keys), ncols), dtype=float)
+        for n, ijk in enumerate(keys):
+            np.concatenate([getattr(self.results[ijk], name).ravel() for name in self._sum_attrs],
+                           out=stack[n])
+        return index, stack
+
+    def _prepare_cov(self):
+        # Build the stacked results before the covariance calculation makes copies of this
+        # object, so all the copies (and all subsequent covariance estimates) share them.
+        if self._sum_attrs is not None and len(self.results) > 0:
+            self._results_stack
+
+    def _patch_cols(self):
+        # Which of the indices in the (i,j,k) keys run over the patches, and how many patches
+        # there are.  The others are always 0.
         if self.npatch3 == 1:
             if self.npatch2 == 1:
                 # k=m=0
-                return [ [(j,k,m) for j,k,m in self.results.keys() if j!=i]
-                         for i in range(self.npatch1) ]
+                return [0], self.npatch1
             elif self.npatch1 == 1:
                 # j=m=0
-                return [ [(j,k,m) for j,k,m in self.results.keys() if k!=i]
-                         for i in range(self.npatch2) ]
+                return [1], self.npatch2
             else:
                 # m=0
                 assert self.npatch1 == self.npatch2
-                return [ [(j,k,m) for j,k,m in self.results.keys() if j!=i and k!=i]
-                         for i in range(self.npatch1) ]
+                return [0,1], self.npatch1
         elif self.npatch2 == 1:
             if self.npatch1 == 1:
                 # j=k=0
-                return [ [(j,k,m) for j,k,m in self.results.keys() if m!=i]
-                         for i in range(self.npatch3) ]
+                return [2], self.npatch3
             else:
                 # k=0
                 assert self.npatch1 == self.npatch3
-                return [ [(j,k,m) for j,k,m in self.results.keys() if j!=i and m!=i]
-                         for i in range(self.npatch1) ]
+                return [0,2], self.npatch1
         elif self.npatch1 == 1:
             # j=0
             assert self.npatch2 == self.npatch3
-            return [ [(j,k,m) for j,k,m in self.results.keys() if k!=i and m!=i]
-                     for i in range(self.npatch2) ]
+            return [1,2], self.npatch2
         else:
             assert self.npatch1 == self.npatch2 == self.npatch3
-            return [ [(j,k,m) for j,k,m in self.results.keys() if j!=i and k!=i and m!=i]
-                     for i in range(self.npatch1) ]
+            return [0,1,2], self.npatch1
+
+    def _jackknife_pairs(self):
+        # Each row uses all the triples that don't involve patch i.
+        # This is done for all the rows at once with an (npatch, len(results)) mask of which
+        # triples touch each patch.
+        cols, npatch = self._patch_cols()
+        keys = list(self.results.keys())
+        ijk = np.array(keys, dtype=int).reshape(-1,3)
+        patches = np.arange(npatch)[:,np.newaxis]
+        touch = np.zeros((npatch, len(keys)), dtype=bool)
+        for c in cols:
+            touch |= ijk[:,c] == patches
+        return [ [keys[n] for n in np.flatnonzero(~t)] for t in touch ]
 
     def _sample_pairs(self):
-        if self.npatch3 == 1:
-            if self.npatch2 == 1:
-                # k=m=0
-                return [ [(j,k,m) for j,k,m in self.results.keys() if j==i]
-                         for i in range(self.npatch1) ]
-            elif self.npatch1 == 1:
-                # j=m=0
-                return [ [(j,k,m) for j,k,m in self.results.keys() if k==i]
-                         for i in range(self.npatch2) ]
-            else:
-                # m=0
-                assert self.npatch1 == self.npatch2
-                return [ [(j,k,m) for j,k,m in self.results.keys() if j==i]
-                         for i in range(self.npatch1) ]
-        elif self.npatch2 == 1:
-            if self.npatch1 == 1:
-                # j=k=0
-                return [ [(j,k,m) for j,k,m in self.results.keys() if m==i]
-                         for i in range(self.npatch3) ]
-            else:
-                # k=0
-                assert self.npatch1 == self.npatch3
-                return [ [(j,k,m) for j,k,m in self.results.keys() if j==i]
-                         for i in range(self.npatch1) ]
-        elif self.npatch1 == 1:
-            # j=0
-            assert self.npatch2 == self.npatch3
-            return [ [(j,k,m) for j,k,m in self.results.keys() if k==i]
-                     for i in range(self.npatch2) ]
-        else:
-            assert self.npatch1 == self.npatch2 == self.npatch3
-            return [ [(j,k,m) for j,k,m in self.results.keys() if j==i]
-                     for i in range(self.npatch1) ]
+        # Each row uses all the triples whose first patch index is i.
+        cols, npatch = self._patch_cols()
+        keys = list(self.results.keys())
+        ijk = np.array(keys, dtype=int).reshape(-1,3)
+        patches = np.arange(npatch)[:,np.newaxis]
+        first = ijk[:,cols[0]] == patches
+        return [ [keys[n] for n in np.flatnonzero(f)] for f in first ]
 
     @lazy_property
     def _ok(self):
@@ -1258,6 +1292,11 @@ class BinnedCorr3(object):
         return ok
 
     def _marked_pairs(self, indx):
+        # Note: The double and triple loops here are done with numpy on the _ok matrix.
+        # This is called once per bootstrap realization, so it's worth making it fast.
+        # np.nonzero returns the indices in C order, so the order matches the equivalent
+        # nested python loops over i in indx, then j, then k.
+        indx = np.asarray(indx)
         if self.npatch3 == 1:
             if self.npatch2 == 1:
                 return [ (i,0,0) for i in indx if self._ok[i,0,0] ]
@@ -1266,25 +1305,34 @@ class BinnedCorr3(object):
             else:
                 assert self.npatch1 == self.npatch2
                 # Select all pairs where first point is in indx (repeating i as appropriate)
-                return [ (i,j,0) for i in indx for j in range(self.npatch2) if self._ok[i,j,0] ]
+                ii, j = np.nonzero(self._ok[indx,:,0])
+                return _triples(indx[ii], j, 0)
         elif self.npatch2 == 1:
             if self.npatch1 == 1:
                 return [ (0,0,i) for i in indx if self._ok[0,0,i] ]
             else:
                 assert self.npatch1 == self.npatch3
                 # Select all pairs where first point is in indx (repeating i as appropriate)
-                return [ (i,0,j) for i in indx for j in range(self.npatch3) if self._ok[i,0,j] ]
+                ii, j = np.nonzero(self._ok[indx,0,:])
+                return _triples(indx[ii], 0, j)
         elif self.npatch1 == 1:
             assert self.npatch2 == self.npatch3
             # Select all pairs where first point is in indx (repeating i as appropriate)
-            return [ (0,i,j) for i in indx for j in range(self.npatch3) if self._ok[0,i,j] ]
+            ii, j = np.nonzero(self._ok[0,indx,:])
+            return _triples(0, indx[ii], j)
         else:
             assert self.npatch1 == self.npatch2 == self.npatch3
             # Select all pairs where first point is in indx (repeating i as appropriate)
-            return [ (i,j,k) for i in indx for j in range(self.npatch2)
-                                           for k in range(self.npatch3) if self._ok[i,j,k] ]
+            ii, j, k = np.nonzero(self._ok[indx])
+            return _triples(indx[ii], j, k)
 
     def _bootstrap_pairs(self, indx):
+        # As in _marked_pairs, the selections from all combinations of indx are done with
+        # numpy, using I and J (and K) as broadcastable versions of the indx array.
+        # e.g. [ (i,j,0) for i in indx for j in indx if self._ok[i,j,0] and i!=j ]
+        indx = np.asarray(indx)
+        I = indx[:,np.newaxis]
+        J = indx[np.newaxis,:]
         if self.npatch3 == 1:
             if self.npatch2 == 1:
                 return [ (i,0,0) for i in indx if self._ok[i,0,0] ]
@@ -1292,19 +1340,22 @@ class BinnedCorr3(object):
                 return [ (0,i,0) for i in indx if self._ok[0,i,0] ]
             else:
                 assert self.npatch1 == self.npatch2
+                ii, jj = np.nonzero(self._ok[I,J,0] & (I!=J))
                 return ([ (i,i,0) for i in indx if self._ok[i,i,0] ] +
-                        [ (i,j,0) for i in indx for j in indx if self._ok[i,j,0] and i!=j ])
+                        _triples(indx[ii], indx[jj], 0))
         elif self.npatch2 == 1:
             if self.npatch1 == 1:
                 return [ (0,0,i) for i in indx if self._ok[0,0,i] ]
             else:
                 assert self.npatch1 == self.npatch3
+                ii, jj = np.nonzero(self._ok[I,0,J] & (I!=J))
                 return ([ (i,0,i) for i in indx if self._ok[i,0,i] ] +
-                        [ (i,0,j) for i in indx for j in indx if self._ok[i,0,j] and i!=j ])
+                        _triples(indx[ii], 0, indx[jj]))
         elif self.npatch1 == 1:
             assert self.npatch2 == self.npatch3
+            ii, jj = np.nonzero(self._ok[0,I,J] & (I!=J))
             return ([ (0,i,i) for i in indx if self._ok[0,i,i] ] +
-                    [ (0,i,j) for i in indx for j in indx if self._ok[0,i,j] and i!=j ])
+                    _triples(0, indx[ii], indx[jj]))
         else:
             # Like for 2pt we want to avoid getting extra copies of what are actually
             # auto-correlations coming from two indices equalling each other in (i,j,k).
@@ -1314,9 +1365,22 @@ class BinnedCorr3(object):
             # Finally get all triples (i,j,k) where they are all different repeated as often
             # as they show up in the triple for loop.
             assert self.npatch1 == self.npatch2 == self.npatch3
+            I3 = indx[:,np.newaxis,np.newaxis]
+            J3 = indx[np.newaxis,:,np.newaxis]
+            K3 = indx[np.newaxis,np.newaxis,:]
+            iij = np.nonzero(self._ok[I,I,J] & (I!=J))
+            iji = np.nonzero(self._ok[I,J,I] & (I!=J))
+            jii = np.nonzero(self._ok[J,I,I] & (I!=J))
+            ijk = np.nonzero(self._ok[I3,J3,K3] & (I3!=J3) & (I3!=K3) & (J3!=K3))
             return ([ (i,i,i) for i in indx if self._ok[i,i,i] ] +
-                    [ (i,i,j) for i in indx for j in indx if self._ok[i,i,j] and i!=j ] +
-                    [ (i,j,i) for i in indx for j in indx if self._ok[i,j,i] and i!=j ] +
-                    [ (j,i,i) for i in indx for j in indx if self._ok[j,i,i] and i!=j ] +
-                    [ (i,j,k) for i in indx for j in indx if i!=j
-                              for k in indx if self._ok[i,j,k] and (i!=k and j!=k) ])
+                    _triples(indx[iij[0]], indx[iij[0]], indx[iij[1]]) +
+                    _triples(indx[iji[0]], indx[iji[1]], indx[iji[0]]) +
+                    _triples(indx[jii[1]], indx[jii[0]], indx[jii[0]]) +
+                    _triples(indx[ijk[0]], indx[ijk[1]], indx[ijk[2]]))
+
+
+def _triples(i, j, k):
+    # Zip up the index arrays i, j, k into a list of (i,j,k) tuples, which can be used as keys
+    # into the results dict.  Any of them may be a scalar (typically 0) rather than an array.
+    i, j, k = np.broadcast_arrays(i, j, k)
+    return list(zip(i.tolist(), j.tolist(), k.tolist()))
@@ -2091,8 +2091,15 @@ class Catalog(object):
                 self.logger.warning("The following patch numbers have no objects: %s",missing)
                 self.logger.warning("This may be a problem depending on your use case.")
             self._patches = []
-            for i in patch_set:
-                indx = np.where(self.patch == i)[0]
+            # Sort the points by patch once, so each patch is a contiguous run of the sorted
+            # indices, rather than searching the whole patch array for each patch.
+            # (The stable sort keeps the original order of the points within each patch.)
+            order = np.argsort(self.patch, kind='stable')
+            sorted_patch = self.patch[order]
+            start = np.searchsorted(sorted_patch, patch_set, side='left')
+            end = np.searchsorted(sorted_patch, patch_set, side='right')
+            for i, i1, i2 in zip(patch_set, start, end):
+                indx = order[i1:i2]
                 x=self.x[indx] if self.x is not None else None
                 y=self.y[indx] if self.y is not None else None
                 z=self.z[indx] if self.z is not None else None
@@ -452,10 +452,11 @@ class GGGCorrelation(BinnedCorr3):
         # This should never trigger.  If you find this assert to fail, please post an
         # issue about it describing your use case that caused it to fail.
         assert np.sum(diag.imag**2) <= 1.e-8 * np.sum(diag.real**2)
-        self.vargam0.ravel()[:] = self.cov.diagonal()[0:self._nbins].real
-        self.vargam1.ravel()[:] = self.cov.diagonal()[self._nbins:2*self._nbins].real
-        self.vargam2.ravel()[:] = self.cov.diagonal()[2*self._nbins:3*self._nbins].real
-        self.vargam3.ravel()[:] = self.cov.diagonal()[3*self._nbins:4*self._nbins].real
+        var = diag.real
+        self.vargam0.ravel()[:] = var[0:self._nbins]
+        self.vargam1.ravel()[:] = var[self._nbins:2*self._nbins]
+        self.vargam2.ravel()[:] = var[2*self._nbins:3*self._nbins]
+        self.vargam3.ravel()[:] = var[3*self._nbins:4*self._nbins]
 
     def _clear(self):
         """Clear the data vectors
@@ -526,30 +527,19 @@ class GGGCorrelation(BinnedCorr3):
         self.ntri[:] += other.ntri[:]
         return self
 
+    # The attributes that _sum adds up.
+    _sum_attrs = ('gam0r', 'gam0i', 'gam1r', 'gam1i', 'gam2r', 'gam2i', 'gam3r', 'gam3i',
+                  'meand1', 'meanlogd1', 'meand2', 'meanlogd2', 'meand3', 'meanlogd3',
+                  'meanu', 'meanv', 'weight', 'ntri')
+
     def _sum(self, others):
         # Equivalent to the operation of:
         #     self._clear()
         #     for other in others:
         #         self += other
         # but no sanity checks and use numpy.sum for faster calculation.
-        np.sum([c.gam0r for c in others], axis=0, out=self.gam0r)
-        np.sum([c.gam0i for c in others], axis=0, out=self.gam0i)
-        np.sum([c.gam1r for c in others], axis=0, out=self.gam1r)
-        np.sum([c.gam1i for c in others], axis=0, out=self.gam1i)
-        np.sum([c.gam2r for c in others], axis=0, out=self.gam2r)
-        np.sum([c.gam2i for c in others], axis=0, out=self.gam2i)
-        np.sum([c.gam3r for c in others], axis=0, out=self.gam3r)
-        np.sum([c.gam3i for c in others], axis=0, out=self.gam3i)
-        np.sum([c.meand1 for c in others], axis=0, out=self.meand1)
-        np.sum([c.meanlogd1 for c in others], axis=0, out=self.meanlogd1)
-        np.sum([c.meand2 for c in others], axis=0, out=self.meand2)
-        np.sum([c.meanlogd2 for c in others], axis=0, out=self.meanlogd2)
-        np.sum([c.meand3 for c in others], axis=0, out=self.meand3)
-        np.sum([c.meanlogd3 for c in others], axis=0, out=self.meanlogd3)
-        np.sum([c.meanu for c in others], axis=0, out=self.meanu)
-        np.sum([c.meanv for c in others], axis=0, out=self.meanv)
-        np.sum([c.weight for c in others], axis=0, out=self.weight)
-        np.sum([c.ntri for c in others], axis=0, out=self.ntri)
+        for name in self._sum_attrs:
+            np.sum([getattr(c, name) for c in others], axis=0, out=getattr(self, name))
 
     def process(self, cat1, cat2=None, cat3=None, metric=None, num_threads=None,
                 comm=None, low_mem=False, initialize=True, finalize=True):
@@ -423,23 +423,18 @@ class KKKCorrelation(BinnedCorr3):
         self.ntri[:] += other.ntri[:]
         return self
 
+    # The attributes that _sum adds up.
+    _sum_attrs = ('zeta', 'meand1', 'meanlogd1', 'meand2', 'meanlogd2', 'meand3', 'meanlogd3',
+                  'meanu', 'meanv', 'weight', 'ntri')
+
     def _sum(self, others):
         # Equivalent to the operation of:
         #     self._clear()
         #     for other in others:
         #         self += other
         # but no sanity checks and use numpy.sum for faster calculation.
-        np.sum([c.zeta for c in others], axis=0, out=self.zeta)
-        np.sum([c.meand1 for c in others], axis=0, out=self.meand1)
-        np.sum([c.meanlogd1 for c in others], axis=0, out=self.meanlogd1)
-        np.sum([c.meand2 for c in others], axis=0, out=self.meand2)
-        np.sum([c.meanlogd2 for c in others], axis=0, out=self.meanlogd2)
-        np.sum([c.meand3 for c in others], axis=0, out=self.meand3)
-        np.sum([c.meanlogd3 for c in others], axis=0, out=self.meanlogd3)
-        np.sum([c.meanu for c in others], axis=0, out=self.meanu)
-        np.sum([c.meanv for c in others], axis=0, out=self.meanv)
-        np.sum([c.weight for c in others], axis=0, out=self.weight)
-        np.sum([c.ntri for c in others], axis=0, out=self.ntri)
+        for name in self._sum_attrs:
+            np.sum([getattr(c, name) for c in others], axis=0, out=getattr(self, name))
 
     def process(self, cat1, cat2=None, cat3=None, metric=None, num_threads=None,
                 comm=None, low_mem=False, initialize=True, finalize=True):